@@ -1,17 +1,46 @@
+import json
+
+CONDITION_PREFIX = "CONDITION::"
+SYSTEM_PREFIX = "SYSTEM::"
+
 class Process:
+    __slots__ = ("process_id", "process_name", "process_roles", "process_steps", "role_index", "step_index")
+
     def __init__(self, process_id, process_name, process_roles, process_steps):
         self.process_id = process_id
         self.process_name = process_name
         self.process_roles = process_roles
         self.process_steps = process_steps
+        # Index roles and steps once so lookups by id are O(1); the first occurrence of an id wins
+        self.role_index = {}
+        for role in process_roles:
+            self.role_index.setdefault(role.role_id, role)
+        self.step_index = {}
+        for step in process_steps:
+            self.step_index.setdefault(step.stripped_id, step)
+
+    def get_role_by_id(self, role_id):
+        return self.role_index.get(role_id)
+
+    def get_step_by_link_target(self, target_id):
+        # Links refer to steps by their id without the CONDITION::/SYSTEM:: prefix, which is how steps are indexed
+        return self.step_index.get(target_id)
 
 class Role:
+    __slots__ = ("role_id", "role_title", "role_notes")
+
     def __init__(self, role_id, role_title, role_notes=None):
         self.role_id = role_id
         self.role_title = role_title
         self.role_notes = role_notes or []
 
 class Step:
+    __slots__ = (
+        "step_id", "step_role", "step_title", "step_description", "next_step", "next_step_yes", "next_step_no",
+        "step_notes", "manual_system", "user_role_code_user_id_user_name", "password_in_test_system", "users_name",
+        "program_id_t_code_screen_name", "additional_attributes", "is_condition", "is_system_step", "stripped_id",
+    )
+
     def __init__(self, step_id, step_role=None, step_title="", step_description=None, next_step=None, next_step_yes=None, next_step_no=None, step_notes=None, manual_system=None, user_role_code_user_id_user_name=None, password_in_test_system=None, users_name=None, program_id_t_code_screen_name=None, **kwargs):
         self.step_id = step_id
         self.step_role = step_role
@@ -28,8 +57,20 @@ class Step:
         self.program_id_t_code_screen_name = program_id_t_code_screen_name
         # Store any additional attributes
         self.additional_attributes = kwargs
+        # Classify the identifier prefix once instead of re-scanning it wherever the step is used
+        self.is_condition = step_id.startswith(CONDITION_PREFIX)
+        self.is_system_step = not self.is_condition and step_id.startswith(SYSTEM_PREFIX)
+        if self.is_condition:
+            self.stripped_id = step_id[len(CONDITION_PREFIX):]
+        elif self.is_system_step:
+            self.stripped_id = step_id[len(SYSTEM_PREFIX):]
+        else:
+            self.stripped_id = self.step_id
 
 def parse_json_to_process(json_data):
+    # Accept the raw JSON document too, so a model response can be decoded and parsed in one call
+    if isinstance(json_data, (str, bytes, bytearray)):
+        json_data = json.loads(json_data)
     process_id = json_data.get("process_id")
     process_name = json_data.get("process_name")
     process_roles = [Role(**role) for role in json_data.get("process_roles", [])]
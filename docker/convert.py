@@ -1,5 +1,6 @@
 import sys
 import os
+import shutil
 import subprocess
 
 def convert_xlsx_to_pdf(xlsx_file, output_dir):
@@ -17,9 +18,38 @@ def convert_pdf_to_png(pdf_file, output_dir):
         'convert', '-density', '300', pdf_file, '-quality', '100', os.path.join(output_dir, '%d.png')
     ], check=True)
 
+def convert_batch(filelist, output_dir):
+    # Convert every workbook listed in filelist into its own numbered subdirectory of output_dir
+    with open(filelist, encoding='utf-8') as f:
+        xlsx_files = [line.strip() for line in f if line.strip()]
+
+    for idx, xlsx_file in enumerate(xlsx_files):
+        file_output_dir = os.path.join(output_dir, str(idx))
+        # Start from an empty directory so no images are left over from a previous batch
+        shutil.rmtree(file_output_dir, ignore_errors=True)
+        os.makedirs(file_output_dir)
+
+        try:
+            convert_xlsx_to_pdf(xlsx_file, file_output_dir)
+            pdf_file = os.path.join(file_output_dir, os.path.splitext(os.path.basename(xlsx_file))[0] + '.pdf')
+            convert_pdf_to_png(pdf_file, file_output_dir)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            # A failed workbook is simply not reported; the rest of the batch continues
+            print(f"Error converting {xlsx_file}: {e}", flush=True)
+            continue
+
+        print(f"converted\t{xlsx_file}\t{file_output_dir}", flush=True)
+
 def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--batch':
+        # Reported paths are matched against the host's file list, which is UTF-8
+        sys.stdout.reconfigure(encoding='utf-8')
+        convert_batch(sys.argv[2], sys.argv[3])
+        return
+
     if len(sys.argv) != 3:
         print("Usage: python convert.py <input_xlsx_file> <output_directory>")
+        print("       python convert.py --batch <file_list> <output_directory>")
         sys.exit(1)
 
     xlsx_file = sys.argv[1]
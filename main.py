@@ -1,62 +1,157 @@
 import openai
+import atexit
 import base64
+import functools
+import hashlib
+import json
 import os
+import socket
 import credentials
 import pandas as pd
 from io import StringIO
 from openai import OpenAI
+import sqlite3
 import subprocess
 import sys
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from business_process import parse_json_to_process
 from mermaid import generate_mermaid_from_process, save_mermaid_chart
 
+# Number of OpenAI requests in flight at the same time, across every workbook being analyzed
+AI_CONCURRENCY = 4
+ai_request_slots = threading.BoundedSemaphore(AI_CONCURRENCY)
+# Number of workbooks converted by a single converter container run
+CONVERT_BATCH_SIZE = 16
+CONVERTER_IMAGE = 'xls2png-converter'
+# Marks the long-lived converter containers started by ConverterContainer
+CONVERTER_LABEL = 'laminar.converter'
+
+# Model and request settings for the sheet analysis; part of the result cache key
+OPENAI_REQUEST_OPTIONS = {"model": "gpt-4o", "temperature": 0, "max_tokens": 4096, "response_format": {"type": "json_object"}}
+
+# Generated sheet descriptions, keyed by a hash of the workbook and everything sent to OpenAI for the sheet
+RESULT_CACHE_FILE = "cache.sqlite3"
+result_cache_lock = threading.Lock()
+
 # Function to set OpenAI API key
 def set_openai_api_key(api_key):
     openai.api_key = api_key
     global client
+    # A single client per key: its connection pool is shared by every sheet request, so TLS sessions are reused
     client = OpenAI(api_key=api_key)
 
 # Initialize OpenAI client
 set_openai_api_key(credentials.OPENAI_API_KEY)
 
 def encode_image(image_path):
+    # Encode in 48 KiB chunks (a multiple of 3 bytes, so no padding until the end) to avoid holding the raw file as well
+    encoded = bytearray()
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        while chunk := image_file.read(48 * 1024):
+            encoded += base64.b64encode(chunk)
+    return encoded.decode('ascii')
+
+@functools.lru_cache(maxsize=1)
+def encode_sample_image():
+    # The sample diagram is the same for every sheet, so it is only read and encoded once
+    return encode_image('./sample.png')
+
+@functools.lru_cache(maxsize=1)
+def load_sample_json():
+    # The JSON template is the same for every sheet, so it is only read once
+    with open('sample.json', 'r') as file:
+        return file.read()
 
 def get_text_data_from_xlsx(xlsx_path, output_dir):
-    # Read the Excel file
-    xls = pd.ExcelFile(xlsx_path)
     csv_data = {}
     
-    # Convert each sheet to CSV and store in memory
-    for sheet_name in xls.sheet_names:
-        df = pd.read_excel(xlsx_path, sheet_name=sheet_name)
-        df = df.fillna('--')
-        df.columns = [col if not col.startswith('Unnamed:') else '--' for col in df.columns]
-        df = df.map(lambda x: str(x).replace(';', ',') if isinstance(x, str) else x)
+    # Read the Excel file once; every sheet is parsed from the same open workbook
+    with pd.ExcelFile(xlsx_path) as xls:
+        # Convert each sheet to CSV and store in memory
+        for sheet_name in xls.sheet_names:
+            df = xls.parse(sheet_name)
+            df = df.fillna('--')
+            df.columns = [col if not col.startswith('Unnamed:') else '--' for col in df.columns]
+            df = df.map(lambda x: str(x).replace(';', ',') if isinstance(x, str) else x)
         
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False, sep=';')
-        csv_data[sheet_name] = csv_buffer.getvalue()
+            csv_buffer = StringIO()
+            df.to_csv(csv_buffer, index=False, sep=';')
+            # Materialize the CSV text once and share it between the prompt and the log file
+            csv_text = csv_buffer.getvalue()
+            csv_buffer.close()
+            csv_data[sheet_name] = csv_text
         
-        # Save CSV to file for logging
-        csv_log_path = os.path.join(output_dir, f"{sheet_name}.csv")
-        with open(csv_log_path, 'w') as csv_file:
-            csv_file.write(csv_buffer.getvalue())
+            # Save CSV to file for logging
+            csv_log_path = os.path.join(output_dir, f"{sheet_name}.csv")
+            with open(csv_log_path, 'w') as csv_file:
+                csv_file.write(csv_text)
     
     return csv_data
 
-def generate_json_for_sheet(text_data, sheet_name, image_path, output_dir):
-    # Encode the image
-    encoded_image = encode_image(image_path)
-    encoded_sample = encode_image('./sample.png')
+def get_sheet_image_paths(image_dir, sheet_count):
+    # Paths of the sheet images ("0.png", "1.png", ...) that exist, in sheet order.
+    # One directory listing replaces an os.path.exists call per sheet.
+    try:
+        with os.scandir(image_dir) as entries:
+            present = {entry.name for entry in entries if entry.name.endswith('.png') and entry.is_file()}
+    except FileNotFoundError:
+        return []
+    return [os.path.join(image_dir, f"{idx}.png") for idx in range(sheet_count) if f"{idx}.png" in present]
+
+@functools.lru_cache(maxsize=1)
+def get_result_cache():
+    # Opened on first use and shared by the pool threads, which serialize access through result_cache_lock
+    connection = sqlite3.connect(RESULT_CACHE_FILE, check_same_thread=False)
+    connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, json TEXT)")
+    return connection
+
+def get_cached_result(key):
+    with result_cache_lock:
+        row = get_result_cache().execute("SELECT json FROM results WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def store_cached_result(key, json_description):
+    with result_cache_lock:
+        connection = get_result_cache()
+        connection.execute("INSERT OR REPLACE INTO results (key, json) VALUES (?, ?)", (key, json_description))
+        connection.commit()
+
+def generate_json_for_sheet(text_data, sheet_name, image_path, output_dir, workbook_key):
+    encoded_sample = encode_sample_image()
     
     # Read the sample JSON file
-    with open('sample.json', 'r') as file:
-        sample_json_content = file.read()
+    sample_json_content = load_sample_json()
+
+    # Re-runs over unchanged sheets reuse the stored description instead of calling OpenAI again. The key covers the
+    # request settings and the prompt, so changing either asks OpenAI again. The rendered sheet image is left out:
+    # ImageMagick stamps creation dates into it, so its bytes differ on every run; the workbook key stands in for it.
+    cache_source = json.dumps([workbook_key, OPENAI_REQUEST_OPTIONS, build_messages(text_data, sheet_name, "", encoded_sample, sample_json_content)])
+    cache_key = hashlib.sha1(cache_source.encode()).hexdigest()
+    json_description = get_cached_result(cache_key)
+    cached = json_description is not None
+    if not cached:
+        # Encode the image
+        encoded_image = encode_image(image_path)
+        messages = build_messages(text_data, sheet_name, encoded_image, encoded_sample, sample_json_content)
+        # Workbooks analyzed concurrently each run their own sheet pool, so the rate-limit bound is held here
+        with ai_request_slots:
+            json_description = request_json_description(messages)
     
-    # Use OpenAI to generate a JSON description of the diagram
+    # Save the JSON description to a file for logging
+    json_log_path = os.path.join(output_dir, f"{sheet_name}_description.json")
+    with open(json_log_path, 'w') as json_file:
+        json_file.write(json_description)
+
+    # Only a reply that parses is cached, so a truncated or malformed one is requested again next run
+    process = parse_json_to_process(json_description)
+    if not cached:
+        store_cached_result(cache_key, json_description)
+    return process
+
+def build_messages(text_data, sheet_name, encoded_image, encoded_sample, sample_json_content):
+    # Prompt for generating a JSON description of the diagram
     messages = [
         {"role": "system", "content": "You are business process analyzer which is analyzing business process description in the form of spreadsheet based on visual representation of the spreadsheet and CSV-formatted extract. Based on this data you are producing a JSON document with description of the business process"},
         {"role": "user", "content": f"Here is the sample image which reflects what kind of diagram what we will build. This image is only for information purposes and not related to the particular business processes that we will handle."},
@@ -86,32 +181,226 @@ Make sure to have all roles and step identifiers unique. For example, step_ident
 """}
     ]
     
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        temperature=0,
-        max_tokens=4096,
-        response_format={ "type": "json_object" }
-    )
-    
-    json_description = response.choices[0].message.content
-    
-    # Save the JSON description to a file for logging
-    json_log_path = os.path.join(output_dir, f"{sheet_name}_description.json")
-    with open(json_log_path, 'w') as json_file:
-        json_file.write(json_description)
-    
-    return json_description
+    return messages
+
+def request_json_description(messages):
+    # Use OpenAI to generate a JSON description of the diagram
+    response = client.chat.completions.create(messages=messages, **OPENAI_REQUEST_OPTIONS)
+    return response.choices[0].message.content
+
+def generate_json_for_sheets(sheets, output_dir, xlsx_path, max_workers=AI_CONCURRENCY, return_exceptions=False):
+    # Each request is a long network wait and the shared client is thread-safe, so sheets are analyzed concurrently.
+    # Yields (sheet_name, process) pairs in completion order. With return_exceptions a failed sheet
+    # yields its exception in place of the process and the other sheets carry on.
+    # The sheets' workbook is identified for the result cache by its location, modification time and size.
+    xlsx_stat = os.stat(xlsx_path)
+    workbook_key = f"{os.path.abspath(xlsx_path)}:{xlsx_stat.st_mtime_ns}:{xlsx_stat.st_size}"
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(generate_json_for_sheet, text_data, sheet_name, image_path, output_dir, workbook_key): sheet_name
+        for sheet_name, text_data, image_path in sheets
+    }
+    try:
+        for future in as_completed(futures):
+            if return_exceptions and future.exception() is not None:
+                yield futures[future], future.exception()
+            else:
+                yield futures[future], future.result()
+    finally:
+        # Drop queued requests when the caller stops early or a request fails
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@functools.lru_cache(maxsize=1)
+def is_docker_available():
+    # Probed once per process; "docker version" with a format string is much cheaper than "docker info"
+    try:
+        result = subprocess.run(['docker', 'version', '--format', '{{.Server.Version}}'], capture_output=True, text=True, timeout=2)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0 and bool(result.stdout.strip())
+
+def refresh_docker_available():
+    # Forget the cached probe so the next is_docker_available() call checks the daemon again
+    is_docker_available.cache_clear()
+
+def run_command(cmd, on_output=print, cancel_event=None, timeout=None):
+    # Run a docker command, streaming its output; returns False if cancelled
+    # The converter writes UTF-8 regardless of the host locale (cp1252 on Windows)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace', bufsize=1)
+
+    # Forward container output line by line instead of buffering it until exit
+    def drain_output():
+        for line in proc.stdout:
+            try:
+                on_output(line.rstrip())
+            except Exception as e:
+                # Keep reading to EOF: a pipe nobody drains would block the converter until the timeout
+                print(f"Error handling converter output {line.rstrip()!r}: {e}", file=sys.stderr)
+
+    reader = threading.Thread(target=drain_output, daemon=True)
+    reader.start()
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while True:
+            try:
+                proc.wait(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_event is not None and cancel_event.is_set():
+                    # docker run proxies SIGTERM to the container (removed by --rm); an exec'd converter
+                    # stops when its long-lived container is removed
+                    proc.terminate()
+                    proc.wait()
+                    return False
+                if deadline is not None and time.monotonic() > deadline:
+                    proc.kill()
+                    proc.wait()
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+    finally:
+        reader.join()
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return True
+
+def run_converter(args, on_output=print, cancel_event=None, timeout=None):
+    # Run the converter image in a fresh container with the given docker arguments
+    return run_command(['docker', 'run', '--rm'] + args, on_output, cancel_event, timeout)
+
+@functools.lru_cache(maxsize=64)
+def abs_dir(path):
+    # The workbooks of a run share a handful of directories, so each is resolved to an absolute path once
+    return os.path.abspath(path)
 
-def convert_xlsx_to_images(xlsx_path, output_dir):
+def convert_xlsx_to_images(xlsx_path, output_dir, on_output=print, cancel_event=None, timeout=None):
     # Run the docker-based conversion
-    subprocess.run([
-        'docker', 'run', '--rm',
-        '-v', f"{os.path.abspath(output_dir)}:/output",
-        '-v', f"{os.path.abspath(os.path.dirname(xlsx_path))}:/input",
-        'xls2png-converter',
-        f"/input/{os.path.basename(xlsx_path)}", "/output"
-    ], check=True)
+    input_dir, file_name = os.path.split(xlsx_path)
+    return run_converter([
+        '-v', f"{abs_dir(output_dir)}:/output",
+        '-v', f"{abs_dir(input_dir)}:/input",
+        CONVERTER_IMAGE,
+        f"/input/{file_name}", "/output"
+    ], on_output, cancel_event, timeout)
+
+def run_converter_batch(cmd, container_paths, output_dir, on_output=print, cancel_event=None, timeout=None, output_subdir=""):
+    # Run a converter batch command for {container_path: xlsx_path} whose /output is output_dir.
+    # Results go to output_subdir, so batches converted into different subdirs do not overwrite each other.
+    # Returns {xlsx_path: image_dir} for every workbook that was converted.
+    batch_dir = os.path.join(output_dir, output_subdir)
+    container_batch_dir = f"/output/{output_subdir}".rstrip("/")
+    os.makedirs(batch_dir, exist_ok=True)
+    # The list is read inside the (Linux) container, so it always uses UTF-8 and LF line endings
+    with open(os.path.join(batch_dir, "filelist.txt"), 'w', encoding='utf-8', newline='\n') as filelist:
+        filelist.write("\n".join(container_paths) + "\n")
+
+    image_dirs = {}
+    usage_printed = []
+
+    def collect_output(line):
+        if line.startswith("Usage:"):
+            usage_printed.append(line)
+        # The converter reports each finished workbook as "converted<TAB>SRC<TAB>OUT_DIR"
+        fields = line.split("\t")
+        xlsx_path = container_paths.get(fields[1]) if len(fields) == 3 and fields[0] == "converted" else None
+        if xlsx_path is not None:
+            image_dirs[xlsx_path] = os.path.join(output_dir, os.path.relpath(fields[2], "/output"))
+        else:
+            # Unrecognized report lines are logged like any other output; their workbook counts as not converted
+            on_output(line)
+
+    try:
+        run_command(cmd + ['--batch', f"{container_batch_dir}/filelist.txt", container_batch_dir], collect_output, cancel_event, timeout)
+    except subprocess.CalledProcessError as e:
+        if usage_printed and not image_dirs:
+            # An image built from an older convert.py rejects --batch with its usage text
+            raise RuntimeError(f"The {CONVERTER_IMAGE} image does not support batch conversion. "
+                               f"Rebuild it with: docker build -t {CONVERTER_IMAGE} ./docker") from e
+        raise
+    return image_dirs
+
+def is_process_alive(pid):
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows, so ask tasklist instead
+        result = subprocess.run(['tasklist', '/FI', f"PID eq {pid}", '/FO', 'CSV', '/NH'], capture_output=True, text=True)
+        return f'"{pid}"' in result.stdout
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, but owned by another user
+        return True
+    return True
+
+def remove_stale_converter_containers():
+    # Converter containers outlive a run whose process died (crash, killed UI) before close() ran.
+    # Only containers started from this host by a process that no longer exists are removed, so the
+    # containers of other running Laminar instances are left alone.
+    result = subprocess.run([
+        'docker', 'ps', '-a', '--filter', f"label={CONVERTER_LABEL}.host={socket.gethostname()}",
+        '--format', f'{{{{.ID}}}}\t{{{{.Label "{CONVERTER_LABEL}.pid"}}}}',
+    ], capture_output=True, text=True)
+    stale_ids = []
+    for line in result.stdout.splitlines():
+        container_id, _, pid = line.partition("\t")
+        if pid.isdigit() and not is_process_alive(int(pid)):
+            stale_ids.append(container_id)
+    if stale_ids:
+        subprocess.run(['docker', 'rm', '-f'] + stale_ids, capture_output=True)
+
+class ConverterContainer:
+    # A converter container kept running for a whole run, so each batch is a cheap "docker exec"
+    # instead of a container create/destroy. Mounts are fixed at start: output_dir as /output and
+    # every input directory as /input/<k>.
+    def __init__(self, input_dirs, output_dir):
+        remove_stale_converter_containers()
+        self.output_dir = output_dir
+        self.mounts = {}
+        pid = os.getpid()
+        args = [
+            'docker', 'run', '-d', '--rm', '--name', f"laminar-xls2png-{pid}-{int(time.time())}",
+            '--label', CONVERTER_LABEL, '--label', f"{CONVERTER_LABEL}.host={socket.gethostname()}", '--label', f"{CONVERTER_LABEL}.pid={pid}",
+            '--entrypoint', 'sleep', '-v', f"{abs_dir(output_dir)}:/output",
+        ]
+        for input_dir in input_dirs:
+            input_dir = abs_dir(input_dir)
+            if input_dir not in self.mounts:
+                self.mounts[input_dir] = f"/input/{len(self.mounts)}"
+                args += ['-v', f"{input_dir}:{self.mounts[input_dir]}"]
+        try:
+            result = subprocess.run(args + [CONVERTER_IMAGE, 'infinity'], capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            # Docker explains the failure (e.g. "Unable to find image") only on stderr
+            raise RuntimeError(f"Could not start the converter container: {e.stderr.strip() or e}") from e
+        self.container_id = result.stdout.strip()
+        # Also removed when the interpreter exits without reaching the caller's close()
+        atexit.register(self.close)
+
+    def container_path(self, xlsx_path):
+        # Map a host workbook path into the mount of the input directory that contains it
+        xlsx_path = os.path.abspath(xlsx_path)
+        for input_dir, mount in self.mounts.items():
+            try:
+                relative_path = os.path.relpath(xlsx_path, input_dir)
+            except ValueError:
+                # Different drive on Windows
+                continue
+            if relative_path != os.pardir and not relative_path.startswith(os.pardir + os.sep):
+                return f"{mount}/{relative_path.replace(os.sep, '/')}"
+        raise ValueError(f"{xlsx_path} is not inside a mounted input directory")
+
+    def convert_batch(self, xlsx_paths, on_output=print, cancel_event=None, timeout=None, output_subdir=""):
+        # Convert several workbooks with one exec. Returns {xlsx_path: image_dir} for every workbook that was converted.
+        # The image's default entrypoint only forwards two arguments, so the batch form goes through entrypoint.sh
+        container_paths = {self.container_path(xlsx_path): xlsx_path for xlsx_path in xlsx_paths}
+        cmd = ['docker', 'exec', self.container_id, '/app/entrypoint.sh']
+        return run_converter_batch(cmd, container_paths, self.output_dir, on_output, cancel_event, timeout, output_subdir)
+
+    def close(self):
+        # Removing the container also stops any conversion still running in it
+        atexit.unregister(self.close)
+        subprocess.run(['docker', 'rm', '-f', self.container_id], capture_output=True)
 
 def main():
     if len(sys.argv) != 2:
@@ -120,22 +409,24 @@ def main():
 
     xlsx_path = sys.argv[1]
     output_dir = "output"
+
+    if not is_docker_available():
+        print("Docker is not available. Please start Docker and try again.")
+        sys.exit(1)
     
     # Convert XLSX to PDF and images
     convert_xlsx_to_images(xlsx_path, output_dir)
     
     csv_data = get_text_data_from_xlsx(xlsx_path, output_dir)
     
-    image_paths = [os.path.join(output_dir, f"{idx}.png") for idx in range(len(csv_data))]
-    existing_image_paths = [path for path in image_paths if os.path.exists(path)]
+    existing_image_paths = get_sheet_image_paths(output_dir, len(csv_data))
+    
+    sheets = [(sheet_name, text_data, image_path) for (sheet_name, text_data), image_path in zip(csv_data.items(), existing_image_paths)]
     
-    for idx, (sheet_name, text_data) in enumerate(csv_data.items()):
-        if idx < len(existing_image_paths):
-            # Generate JSON description for each sheet
-            json_description = generate_json_for_sheet(text_data, sheet_name, existing_image_paths[idx], output_dir)
-            process = parse_json_to_process(json.loads(json_description))
-            mermaid_chart = generate_mermaid_from_process(process)
-            save_mermaid_chart(mermaid_chart, os.path.join(output_dir, f"{sheet_name}_flowchart.mmd"))
+    # Generate JSON description for each sheet
+    for sheet_name, process in generate_json_for_sheets(sheets, output_dir, xlsx_path):
+        mermaid_chart = generate_mermaid_from_process(process)
+        save_mermaid_chart(mermaid_chart, os.path.join(output_dir, f"{sheet_name}_flowchart.mmd"))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,7 +1,13 @@
-from business_process import Process
+from business_process import CONDITION_PREFIX, SYSTEM_PREFIX, Process
+
+# Styling shared by every generated chart
+NOTE_LINK_STYLE = "stroke:#d3d3d3,stroke-width:2px;"  # Light gray link
+YES_LINK_STYLE = "stroke:#0f0,stroke-width:2px;"
+NO_LINK_STYLE = "stroke:#f00,stroke-width:2px;"
+NOTE_CLASS_DEF = "classDef noteClass fill:#fff,stroke:#333,color:#aaaaaa;\n"
 
 def strip_prefix(step_id):
-    prefixes = ["CONDITION::", "SYSTEM::"]
+    prefixes = [CONDITION_PREFIX, SYSTEM_PREFIX]
     for prefix in prefixes:
         if step_id.startswith(prefix):
             return step_id.replace(prefix, "")
@@ -34,7 +40,7 @@ def generate_mermaid_from_process(process: Process) -> str:
     """
     Generate a Mermaid flowchart from a Process object.
     """
-    mermaid = "flowchart TD\n"
+    mermaid = ["flowchart TD\n"]  # Output pieces, joined once at the end
     role_subgraphs = {}
     links = []
     link_styles = []  # Separate list for link styles
@@ -44,104 +50,104 @@ def generate_mermaid_from_process(process: Process) -> str:
 
     # Create subgraphs for each role
     for role in process.process_roles:
-        role_subgraphs[role.role_id] = f"subgraph {role.role_id} [{role.role_title}]\n"
+        role_subgraphs[role.role_id] = [f"subgraph {role.role_id} [{role.role_title}]\n"]
+
+    def add_link(source_id, target_id, condition_text="", style=""):
+        nonlocal link_counter
+        if process.get_step_by_link_target(target_id):
+            if condition_text:
+                links.append(f"{source_id} -- {condition_text} --> {target_id}")
+            else:
+                links.append(f"{source_id} --> {target_id}")
+            # Append style to link_styles list
+            if style:
+                link_styles.append(f"linkStyle {link_counter} {style}")
+            link_counter += 1
 
     # Add steps to the appropriate subgraph or main graph if no role
     for step in process.process_steps:
         step_id = step.step_id
-        stripped_step_id = strip_prefix(step_id)
+        stripped_step_id = step.stripped_id
         step_line = ""
-        if step_id.startswith("CONDITION::"):
-            condition_id = step_id.replace("CONDITION::", "")
+        if step.is_condition:
             formatted_label = format_step_label(step)
-            step_line = f"    {condition_id}@{{ shape: hexagon, label: \"{formatted_label}\" }}\n"
-        elif step_id.startswith("SYSTEM::START"):
+            step_line = f"    {stripped_step_id}@{{ shape: hexagon, label: \"{formatted_label}\" }}\n"
+        elif step.is_system_step and stripped_step_id.startswith("START"):
             step_line = f"    START@{{ shape: circle, label: \"START\" }}\n"
-        elif step_id.startswith("SYSTEM::END"):
+        elif step.is_system_step and stripped_step_id.startswith("END"):
             step_line = f"    END@{{ shape: double-circle, label: \"END\" }}\n"
-        elif step_id.startswith("SYSTEM::ABORT"):
+        elif step.is_system_step and stripped_step_id.startswith("ABORT"):
             step_line = f"    ABORT@{{ shape: double-circle, label: \"ABORT\" }}\n"
         else:
             formatted_label = format_step_label(step)
             step_line = f"    {step_id}({formatted_label})\n"
 
         if step.step_role:
-            role_subgraphs[step.step_role] += step_line
+            role_subgraphs[step.step_role].append(step_line)
         else:
-            mermaid += step_line
+            mermaid.append(step_line)
 
         # Collect step descriptions to be added later
         if step.step_description or step.step_notes:
             description_id = f"{stripped_step_id}_desc"
             description_line = f"{description_id}@{{shape: braces, label: \"{sanitize_label(step.step_description or 'Notes')}\"}}\n"
             if step.step_role:
-                role_subgraphs[step.step_role] += description_line
+                role_subgraphs[step.step_role].append(description_line)
             else:
                 descriptions.append(description_line)
             links.append(f"{stripped_step_id} -.-o {description_id}")
-            link_styles.append(f"linkStyle {link_counter} stroke:#d3d3d3,stroke-width:2px;")  # Light gray link
+            link_styles.append(f"linkStyle {link_counter} {NOTE_LINK_STYLE}")
             link_counter += 1
 
         # Add notes as separate blocks linked to descriptions
         if step.step_notes:
-            for note in step.step_notes:
-                note_id = f"{stripped_step_id}_note_{step.step_notes.index(note)}"
+            for note_index, note in enumerate(step.step_notes):
+                note_id = f"{stripped_step_id}_note_{note_index}"
                 descriptions.append(f"{note_id}@{{shape: comment, label: \"{sanitize_label(note)}\"}}\n")
                 links.append(f"{description_id} -.-o {note_id}")
-                link_styles.append(f"linkStyle {link_counter} stroke:#d3d3d3,stroke-width:2px;")  # Light gray link
+                link_styles.append(f"linkStyle {link_counter} {NOTE_LINK_STYLE}")
                 link_counter += 1
                 note_ids.append(note_id)  # Add to note_ids list
 
-        def add_link(source_id, target_id, condition_text="", style=""):
-            nonlocal link_counter
-            target_step = next((s for s in process.process_steps if strip_prefix(s.step_id) == target_id), None)
-            if target_step:
-                if condition_text:
-                    links.append(f"{strip_prefix(source_id)} -- {condition_text} --> {target_id}")
-                else:
-                    links.append(f"{strip_prefix(source_id)} --> {target_id}")
-                # Append style to link_styles list
-                if style:
-                    link_styles.append(f"linkStyle {link_counter} {style}")
-                link_counter += 1
-
         if step.next_step:
-            add_link(step_id, strip_prefix(step.next_step))
+            add_link(stripped_step_id, strip_prefix(step.next_step))
         if step.next_step_yes:
             condition_text = step.additional_attributes.get("yes_when", "yes")
-            add_link(step_id, strip_prefix(step.next_step_yes), condition_text, "stroke:#0f0,stroke-width:2px;")
+            add_link(stripped_step_id, strip_prefix(step.next_step_yes), condition_text, YES_LINK_STYLE)
         if step.next_step_no:
             condition_text = step.additional_attributes.get("no_when", "no")
-            add_link(step_id, strip_prefix(step.next_step_no), condition_text, "stroke:#f00,stroke-width:2px;")
+            add_link(stripped_step_id, strip_prefix(step.next_step_no), condition_text, NO_LINK_STYLE)
 
     # Close each subgraph and add to the main mermaid string
     for subgraph in role_subgraphs.values():
-        subgraph += "end\n"
-        mermaid += subgraph
+        mermaid.extend(subgraph)
+        mermaid.append("end\n")
 
     # Add step descriptions at the end
-    for description in descriptions:
-        mermaid += description        
+    mermaid.extend(descriptions)
 
     # Add links outside of subgraphs
     for link in links:
-        mermaid += f"{link}\n"
+        mermaid.append(f"{link}\n")
 
     # Append link styles at the bottom
     for style in link_styles:
-        mermaid += f"{style}\n"
+        mermaid.append(f"{style}\n")
 
     # Define class for notes with dark gray text
-    mermaid += "classDef noteClass fill:#fff,stroke:#333,color:#aaaaaa;\n"
+    mermaid.append(NOTE_CLASS_DEF)
     # Apply class to each note node individually
     for note_id in note_ids:
-        mermaid += f"class {note_id} noteClass;\n"
+        mermaid.append(f"class {note_id} noteClass;\n")
 
-    return mermaid
+    return "".join(mermaid)
 
 def save_mermaid_chart(mermaid_chart: str, output_file: str):
     """
     Save the Mermaid chart to a file.
     """
-    with open(output_file, 'w') as file:
-        file.write(mermaid_chart)
\ No newline at end of file
+    data = mermaid_chart.encode('utf-8')
+    # Encode once and hand the whole chart to a single write call. The default buffer is enough:
+    # small charts are flushed in one write on close, larger ones bypass the buffer entirely.
+    with open(output_file, 'wb') as file:
+        file.write(data)
\ No newline at end of file
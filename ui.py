@@ -1,15 +1,59 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+import atexit
+import importlib
 import os
-import subprocess
+import shutil
+import stat
 import time
 import threading
-import credentials
-import json
-from main import get_text_data_from_xlsx, generate_json_for_sheet, parse_json_to_process, set_openai_api_key
-from mermaid import generate_mermaid_from_process, save_mermaid_chart
+import collections
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+# main (pandas, OpenAI SDK), mermaid and credentials are imported where they are used, so the window
+# shows up without waiting for them; main is warmed up on a background thread once the window is up
 
 API_KEY_FILE = "openai_key.txt"
+LOG_PUMP_INTERVAL_MS = 50
+LOG_PUMP_BATCH_SIZE = 500
+LOG_FILE = "log.txt"
+# Quiet period after the last edit of a path field before the paths are checked on disk
+PATH_VALIDATION_DELAY_MS = 200
+# Workbooks of a converted batch analyzed at the same time (each one also runs its sheets concurrently)
+FILE_CONCURRENCY = 4
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+# Lowercased suffixes without the dot, so a name is matched with one rpartition and a set lookup
+EXCEL_SUFFIXES = frozenset(ext[1:].lower() for ext in EXCEL_EXTENSIONS)
+
+def stat_mode(path):
+    # A single stat per path answers both "is it a file" and "is it a directory"
+    try:
+        return os.stat(path).st_mode
+    except (OSError, ValueError):
+        return 0
+
+def iter_excel_files(path):
+    # Walk the tree with scandir and an explicit stack: one pass, no recursion depth limit,
+    # and the directory entry type is reused instead of a stat per file
+    pending_dirs = [path]
+    while pending_dirs:
+        try:
+            entries = os.scandir(pending_dirs.pop())
+        except OSError:
+            # Unreadable directories are skipped, as os.walk does
+            continue
+        subdirs = []
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    _, dot, suffix = entry.name.rpartition('.')
+                    if dot and suffix.lower() in EXCEL_SUFFIXES:
+                        yield entry.path
+        # Reversed so subdirectories are visited in listing order
+        pending_dirs.extend(reversed(subdirs))
 
 class App:
     def __init__(self, root):
@@ -33,8 +77,14 @@ class App:
         # Excel File/Folder Upload
         self.upload_label = tk.Label(self.main_frame, text="Select Excel File(s) or Folder(s):")
         self.upload_label.grid(row=0, column=0, sticky="w")
-        self.upload_button = tk.Button(self.main_frame, text="Browse", command=self.show_upload_options)
-        self.upload_button.grid(row=0, column=1, padx=5, sticky="ew")
+        self.upload_buttons_frame = tk.Frame(self.main_frame)
+        self.upload_buttons_frame.grid(row=0, column=1, padx=5, sticky="ew")
+        self.upload_buttons_frame.columnconfigure(0, weight=1)
+        self.upload_buttons_frame.columnconfigure(1, weight=1)
+        self.upload_files_button = tk.Button(self.upload_buttons_frame, text="Files...", command=self.upload_files)
+        self.upload_files_button.grid(row=0, column=0, sticky="ew")
+        self.upload_folder_button = tk.Button(self.upload_buttons_frame, text="Folder...", command=self.upload_directory)
+        self.upload_folder_button.grid(row=0, column=1, sticky="ew")
         self.file_paths_var = tk.StringVar()
         self.file_paths_var.trace("w", self.validate_paths)
         self.file_paths_entry = tk.Entry(self.main_frame, textvariable=self.file_paths_var, width=50)
@@ -73,19 +123,32 @@ class App:
         self.settings_button = tk.Button(self.main_frame, text="Settings", command=self.open_settings)
         self.settings_button.grid(row=6, column=0, columnspan=3, pady=5, sticky="ew")
 
+        # Widgets locked while a run is active
+        self.toggleable_widgets = (self.upload_files_button, self.upload_folder_button, self.output_button, self.run_terminate_button, self.settings_button, self.file_paths_entry, self.output_dir_entry)
+
         self.processing_thread = None
         self.terminate_flag = threading.Event()
+        self.progress_lock = threading.Lock()
+        self.current_step = 0
+        self.total_steps = 0
         self.error_occurred = False  # Track if an error occurred
-
-    def show_upload_options(self):
-        option = messagebox.askquestion("Select Option", "Do you want to process a whole directory?", icon='question', type='yesno', default='yes', detail="No: Single or multiple file(s)\nYes: Directory contents")
-        if option == 'no':
-            self.upload_files()
-        elif option == 'yes':
-            self.upload_directory()
+        self.validate_after_id = None  # Pending debounced path check
+        self.last_validated_paths = None  # (input paths, output dir) of the last check
+
+        # Log lines and progress are published by worker threads and applied by a single Tk-side pump
+        self.log_queue = collections.deque()
+        self.pending_progress = None
+        self.log_timestamp = (None, "")  # (epoch second, formatted timestamp)
+        # Kept open for the whole session; the pump writes each batch and flushes once per tick
+        self.log_file = open(LOG_FILE, "a", buffering=64 * 1024, encoding="utf-8")
+        atexit.register(self.log_file.close)
+        # Offset in log.txt where the lines shown in the listbox begin (the file also holds earlier sessions)
+        self.log_file_start = self.log_file.tell()
+        self.root.after(LOG_PUMP_INTERVAL_MS, self.drain_log_queue)
+        self.root.after_idle(lambda: threading.Thread(target=importlib.import_module, args=("main",), daemon=True).start())
 
     def upload_files(self):
-        file_paths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx *.xlsm *.xls")])
+        file_paths = filedialog.askopenfilenames(filetypes=[("Excel files", " ".join(f"*{ext}" for ext in EXCEL_EXTENSIONS))])
         self.file_paths_var.set(';'.join(file_paths))
         self.list_eligible_files(file_paths)
 
@@ -101,23 +164,38 @@ class App:
             self.output_dir_var.set(output_dir)
 
     def validate_paths(self, *args):
-        input_paths = self.file_paths_var.get().split(';')
-        output_dir = self.output_dir_var.get()
-        if all(os.path.exists(path) for path in input_paths) and os.path.isdir(output_dir):
+        # Traced on every keystroke; the filesystem is only checked once typing pauses
+        if self.validate_after_id is not None:
+            self.root.after_cancel(self.validate_after_id)
+        self.validate_after_id = self.root.after(PATH_VALIDATION_DELAY_MS, self.check_paths)
+
+    def check_paths(self):
+        self.validate_after_id = None
+        paths = (self.file_paths_var.get(), self.output_dir_var.get())
+        if paths == self.last_validated_paths:
+            return
+        self.last_validated_paths = paths
+        input_paths = paths[0].split(';')
+        output_dir = paths[1]
+        # Check the single output directory first so inputs are not stat'ed while it is still empty
+        if os.path.isdir(output_dir) and all(stat_mode(path) for path in input_paths):
             self.run_terminate_button.config(state=tk.NORMAL)
         else:
             self.run_terminate_button.config(state=tk.DISABLED)
 
     def list_eligible_files(self, paths):
         self.log_listbox.delete(0, tk.END)
+        self.log_file.flush()
+        self.log_file_start = self.log_file.tell()
+        # Only reachable while no run is active, so the listing can be exported right away
+        self.export_log_button.config(state=tk.NORMAL)
         for path in paths:
-            if os.path.isfile(path):
+            mode = stat_mode(path)
+            if stat.S_ISREG(mode):
                 self.log(f"File: {path}")
-            elif os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    for file in files:
-                        if file.endswith(('.xlsx', '.xlsm', '.xls')):
-                            self.log(f"File: {os.path.join(root, file)}")
+            elif stat.S_ISDIR(mode):
+                for file in iter_excel_files(path):
+                    self.log(f"File: {file}")
 
     def toggle_process(self):
         if self.processing_thread and self.processing_thread.is_alive():
@@ -126,7 +204,14 @@ class App:
             self.start_process()
 
     def start_process(self):
+        from main import is_docker_available, refresh_docker_available
+        if not is_docker_available():
+            # Probe again on the next run in case Docker gets started in the meantime
+            refresh_docker_available()
+            messagebox.showerror("Error", "Docker is not available. Please start Docker and try again.")
+            return
         self.disable_controls()
+        self.export_log_button.config(state=tk.DISABLED)
         self.run_terminate_button.config(text="Terminate", state=tk.NORMAL)  # Enable the terminate button
         self.terminate_flag.clear()
         self.error_occurred = False  # Reset error flag
@@ -145,59 +230,69 @@ class App:
             self.enable_controls()
             return
 
-        total_steps = len(input_paths) * 5
-        current_step = 0
+        self.total_steps = len(input_paths) * 5
+        self.current_step = 0
 
         temp_dir = os.path.join(os.path.dirname(__file__), "output")
         os.makedirs(temp_dir, exist_ok=True)
 
-        for path in input_paths:
-            if self.terminate_flag.is_set():
-                break
-            if os.path.isfile(path):
-                files_to_process = [path]
-            else:
-                files_to_process = [os.path.join(dp, f) for dp, dn, filenames in os.walk(path) for f in filenames if f.endswith(('.xlsx', '.xlsm', '.xls'))]
-
-            for file in files_to_process:
-                if self.terminate_flag.is_set():
-                    break
-                self.log(f"Processing {file}")
-                self.update_progress(current_step, total_steps)
-                try:
-                    self.convert_xlsx_to_images(file, temp_dir)
-                    self.log(f"Converted {file} to images and CSV")
-                    current_step += 1
-                    self.update_progress(current_step, total_steps)
-
-                    csv_data = get_text_data_from_xlsx(file, temp_dir)
-                    self.log(f"Found {len(csv_data)} worksheets in {file}: {', '.join(csv_data.keys())}")
-                    image_paths = [os.path.join(temp_dir, f"{idx}.png") for idx in range(len(csv_data))]
-                    existing_image_paths = [path for path in image_paths if os.path.exists(path)]
-                    
-                    file_output_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(file))[0])
-                    os.makedirs(file_output_dir, exist_ok=True)
-
-                    for idx, (sheet_name, text_data) in enumerate(csv_data.items()):
-                        if idx < len(existing_image_paths):
-                            if self.terminate_flag.is_set():
-                                break
-                            self.log(f"Processing sheet: {sheet_name}")
-                            json_description = generate_json_for_sheet(text_data, sheet_name, existing_image_paths[idx], temp_dir)
-                            process = parse_json_to_process(json.loads(json_description))
-                            mermaid_chart = generate_mermaid_from_process(process)
-                            mermaid_file_path = os.path.join(file_output_dir, f"{sheet_name}_flowchart.mmd")
-                            save_mermaid_chart(mermaid_chart, mermaid_file_path)
-                            self.log(f"Generated mermaid diagram: {mermaid_file_path}")
-                            current_step += 1
-                            self.update_progress(current_step, total_steps)
-
-                except Exception as e:
-                    self.log(f"Error processing {file}: {e}")
-                    messagebox.showerror("Error", f"An error occurred while processing {file}: {e}")
-                    self.error_occurred = True  # Set error flag
-
-        self.progress_var.set(100)
+        from main import ConverterContainer
+
+        # One converter container serves the whole run; each selected folder (or a file's folder) is mounted up front
+        try:
+            converter = ConverterContainer([path if stat.S_ISDIR(stat_mode(path)) else os.path.dirname(path) for path in input_paths], temp_dir)
+        except Exception as e:
+            self.log(f"Error starting the converter container: {e}")
+            messagebox.showerror("Error", f"An error occurred while starting the converter container: {e}")
+            self.enable_controls()
+            self.run_terminate_button.config(text="Run")
+            return
+
+        # Workbooks are parsed (pandas/openpyxl, CPU-bound Python) in child processes, so the worker
+        # threads do not hold the GIL the Tk event loop needs. Spawned rather than forked, since this
+        # process already runs several threads.
+        workbook_pool = ProcessPoolExecutor(max_workers=FILE_CONCURRENCY, mp_context=multiprocessing.get_context("spawn"))
+
+        try:
+            batches = self.iter_conversion_batches(input_paths)
+            # Conversion runs one batch ahead on its own thread: docker converts the next batch while
+            # OpenAI analyzes the current one. Consecutive batches use alternating output subdirs.
+            with ThreadPoolExecutor(max_workers=1) as conversion_executor:
+                batch_index = 0
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    next_conversion = self.submit_conversion(conversion_executor, converter, next_batch, batch_index)
+                while next_batch is not None and not self.terminate_flag.is_set():
+                    batch, conversion = next_batch, next_conversion
+                    batch_index += 1
+                    next_batch = next(batches, None)
+                    if next_batch is not None:
+                        next_conversion = self.submit_conversion(conversion_executor, converter, next_batch, batch_index)
+
+                    try:
+                        image_dirs = conversion.result()
+                    except Exception as e:
+                        self.log(f"Error converting {', '.join(batch)}: {e}")
+                        messagebox.showerror("Error", f"An error occurred while converting files to images: {e}")
+                        self.error_occurred = True  # Set error flag
+                        continue
+
+                    # Files are dominated by network waits on OpenAI, so a converted batch is analyzed concurrently
+                    with ThreadPoolExecutor(max_workers=FILE_CONCURRENCY) as executor:
+                        futures = {executor.submit(self.process_file, file, image_dirs.get(file), output_dir, workbook_pool): file for file in batch}
+                        for future in as_completed(futures):
+                            file = futures[future]
+                            try:
+                                future.result()
+                            except Exception as e:
+                                self.log(f"Error processing {file}: {e}")
+                                messagebox.showerror("Error", f"An error occurred while processing {file}: {e}")
+                                self.error_occurred = True  # Set error flag
+        finally:
+            converter.close()
+            workbook_pool.shutdown(cancel_futures=True)
+
+        self.update_progress(self.total_steps, self.total_steps)
         if not self.terminate_flag.is_set():
             if not self.error_occurred:
                 self.log("All files processed successfully.")
@@ -209,36 +304,127 @@ class App:
             self.log("Process terminated by user.")
         self.enable_controls()
         self.run_terminate_button.config(text="Run")
-        self.export_log_button.config(state=tk.NORMAL)
 
-    def convert_xlsx_to_images(self, xlsx_path, temp_dir):
-        subprocess.run([
-            'docker', 'run', '--rm',
-            '-v', f"{os.path.abspath(temp_dir)}:/output",
-            '-v', f"{os.path.abspath(os.path.dirname(xlsx_path))}:/input",
-            'xls2png-converter',
-            f"/input/{os.path.basename(xlsx_path)}", "/output"
-        ], check=True)
+    def process_file(self, file, image_dir, output_dir, workbook_pool):
+        # Analyze one converted workbook and write a mermaid diagram per sheet; runs on a pool thread
+        if self.terminate_flag.is_set():
+            return
+        self.log(f"Processing {file}")
+        if image_dir is None:
+            raise RuntimeError("conversion to images failed")
+        self.log(f"Converted {file} to images and CSV")
+        self.advance_progress()
+
+        from main import get_sheet_image_paths, get_text_data_from_xlsx, generate_json_for_sheets
+        from mermaid import generate_mermaid_from_process, save_mermaid_chart
+
+        # image_dir is created by the converter, as root under rootful Docker, so it is only read from.
+        # The CSV and JSON logs go to a sibling folder created here on the host.
+        log_dir = f"{image_dir}_log"
+        os.makedirs(log_dir, exist_ok=True)
+        csv_data = workbook_pool.submit(get_text_data_from_xlsx, file, log_dir).result()
+        self.log(f"Found {len(csv_data)} worksheets in {file}: {', '.join(csv_data.keys())}")
+        existing_image_paths = get_sheet_image_paths(image_dir, len(csv_data))
+        
+        file_output_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(file))[0])
+        os.makedirs(file_output_dir, exist_ok=True)
+
+        sheets = [(sheet_name, text_data, image_path) for (sheet_name, text_data), image_path in zip(csv_data.items(), existing_image_paths)]
+        self.log(f"Processing sheets: {', '.join(sheet_name for sheet_name, _, _ in sheets)}")
+        for sheet_name, process in generate_json_for_sheets(sheets, log_dir, file, return_exceptions=True):
+            if self.terminate_flag.is_set():
+                break
+            # One failed sheet does not stop the rest of the workbook
+            if isinstance(process, Exception):
+                self.log(f"Error analyzing sheet {sheet_name} of {file}: {process}")
+                self.error_occurred = True  # Set error flag
+                continue
+            mermaid_file_path = os.path.join(file_output_dir, f"{sheet_name}_flowchart.mmd")
+            try:
+                mermaid_chart = generate_mermaid_from_process(process)
+                save_mermaid_chart(mermaid_chart, mermaid_file_path)
+            except Exception as e:
+                self.log(f"Error generating mermaid diagram for sheet {sheet_name} of {file}: {e}")
+                self.error_occurred = True  # Set error flag
+                continue
+            self.log(f"Generated mermaid diagram: {mermaid_file_path}")
+            self.advance_progress()
+
+    def iter_conversion_batches(self, input_paths):
+        # Convert workbooks in batches so each converter exec handles several files.
+        # Individually selected files share batches, grouped by folder; a walked folder already
+        # yields the files of each directory together.
+        from main import CONVERT_BATCH_SIZE
+        selected_files = []
+        folders = []
+        for path in input_paths:
+            (selected_files if stat.S_ISREG(stat_mode(path)) else folders).append(path)
+        selected_files.sort(key=os.path.dirname)
+        for files_to_process in itertools.chain([selected_files], (list(iter_excel_files(folder)) for folder in folders)):
+            if self.terminate_flag.is_set():
+                return
+            for batch_start in range(0, len(files_to_process), CONVERT_BATCH_SIZE):
+                yield files_to_process[batch_start:batch_start + CONVERT_BATCH_SIZE]
+
+    def submit_conversion(self, executor, converter, xlsx_paths, batch_index):
+        self.log(f"Converting {len(xlsx_paths)} file(s) to images")
+        return executor.submit(self.convert_xlsx_batch_to_images, converter, xlsx_paths, str(batch_index % 2))
+
+    def convert_xlsx_batch_to_images(self, converter, xlsx_paths, output_subdir):
+        return converter.convert_batch(xlsx_paths, on_output=self.log, cancel_event=self.terminate_flag, output_subdir=output_subdir)
+
+    def advance_progress(self):
+        # Called from several pool threads, so the shared step counter is updated under a lock
+        with self.progress_lock:
+            self.current_step += 1
+            self.update_progress(self.current_step, self.total_steps)
 
     def update_progress(self, current_step, total_steps):
-        progress = (current_step / total_steps) * 100
-        self.progress_var.set(progress)
-        self.root.update_idletasks()
+        # Only the latest value matters; it is applied on the next pump tick
+        self.pending_progress = (current_step / total_steps) * 100
+
+    def format_timestamp(self):
+        # Format the clock at most once per second; lines logged within the same second reuse the string
+        now = int(time.time())
+        second, timestamp = self.log_timestamp
+        if second != now:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+            self.log_timestamp = (now, timestamp)
+        return timestamp
 
     def log(self, message):
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"{timestamp} - {message}"
-        self.log_listbox.insert(tk.END, log_message)
-        self.log_listbox.yview(tk.END)
-        with open("log.txt", "a") as log_file:
-            log_file.write(log_message + "\n")
-        self.export_log_button.config(state=tk.NORMAL if self.log_listbox.size() > 0 and (self.processing_thread is None or not self.processing_thread.is_alive()) else tk.DISABLED        )
+        log_message = f"{self.format_timestamp()} - {message}"
+        self.log_queue.append(log_message)
+
+    def drain_log_queue(self):
+        # Insert queued log lines in one call and scroll once, instead of one redraw per line,
+        # and append them to the log file with a single write
+        batch = []
+        while self.log_queue and len(batch) < LOG_PUMP_BATCH_SIZE:
+            batch.append(self.log_queue.popleft())
+        if batch:
+            self.log_listbox.insert(tk.END, *batch)
+            self.log_listbox.yview(tk.END)
+            self.log_file.write("\n".join(batch) + "\n")
+            self.log_file.flush()
+        progress = self.pending_progress
+        if progress is not None and progress != self.progress_var.get():
+            self.progress_var.set(progress)
+        self.root.after(LOG_PUMP_INTERVAL_MS, self.drain_log_queue)
 
     def export_log(self):
         log_file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
         if log_file_path:
-            with open(log_file_path, "w") as log_file:
-                log_file.writelines("\n".join(self.log_listbox.get(0, tk.END)))
+            self.log_file.flush()
+            try:
+                # The listbox mirrors log.txt from log_file_start on, so the export is a plain file copy
+                with open(LOG_FILE, "rb") as source, open(log_file_path, "wb") as target:
+                    source.seek(self.log_file_start)
+                    shutil.copyfileobj(source, target)
+            except FileNotFoundError:
+                # log.txt was removed while the app was running; export what the listbox shows, as UTF-8 like log.txt
+                with open(log_file_path, "w", encoding="utf-8") as log_file:
+                    log_file.writelines(f"{line}\n" for line in self.log_listbox.get(0, tk.END))
             messagebox.showinfo("Export Log", f"Log exported to {log_file_path}")
 
     def open_settings(self):
@@ -259,6 +445,7 @@ class App:
         if api_key:
             with open(API_KEY_FILE, "w") as f:
                 f.write(api_key)
+            from main import set_openai_api_key
             set_openai_api_key(api_key)  # Update the OpenAI API key dynamically
             messagebox.showinfo("Settings", "Settings saved successfully.")
         else:
@@ -268,23 +455,20 @@ class App:
         if os.path.exists(API_KEY_FILE):
             with open(API_KEY_FILE, "r") as f:
                 return f.read().strip()
+        import credentials
         return credentials.OPENAI_API_KEY
 
+    def set_controls_state(self, state):
+        for widget in self.toggleable_widgets:
+            widget.config(state=state)
+
     def disable_controls(self):
-        self.upload_button.config(state=tk.DISABLED)
-        self.output_button.config(state=tk.DISABLED)
-        self.run_terminate_button.config(state=tk.DISABLED)
-        self.settings_button.config(state=tk.DISABLED)
-        self.file_paths_entry.config(state=tk.DISABLED)
-        self.output_dir_entry.config(state=tk.DISABLED)
+        self.set_controls_state(tk.DISABLED)
 
     def enable_controls(self):
-        self.upload_button.config(state=tk.NORMAL)
-        self.output_button.config(state=tk.NORMAL)
-        self.run_terminate_button.config(state=tk.NORMAL)
-        self.settings_button.config(state=tk.NORMAL)
-        self.file_paths_entry.config(state=tk.NORMAL)
-        self.output_dir_entry.config(state=tk.NORMAL)
+        self.set_controls_state(tk.NORMAL)
+        # The export button changes state only here and in start_process, not per log line
+        self.export_log_button.config(state=tk.NORMAL)
 
 if __name__ == "__main__":
     root = tk.Tk()